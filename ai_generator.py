@@ -1,131 +1,245 @@
 import google.generativeai as genai
 import os
+import asyncio
+import functools
+import hashlib
+import io
 import json
-from typing import Dict, List, Optional
-import cv2
+import orjson
+import re
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+import diskcache
 from datetime import datetime
 from dotenv import load_dotenv
-import base64
-import tempfile
-from PIL import Image
-import numpy as np
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 # Load environment variables from .env file
 load_dotenv()
 
+MODEL_NAME = 'gemini-2.0-flash-exp'
+
+# Fixed instruction for the combined metadata request; sent as the system
+# instruction so each call only carries the frames
+METADATA_INSTRUCTION = """
+You analyze video frames and create YouTube metadata for the video.
+
+"analysis": describe briefly what you see. Focus on:
+1. Main subject/person and their actions
+2. Setting/location 
+3. Key objects or activities visible
+4. Overall mood and style
+Keep it concise and specific to what's actually shown in the images.
+
+"title": a catchy YouTube title based on the analysis.
+- Make it engaging and click-worthy
+- Keep it under 80 characters
+- Focus on the main subject/activity in the video
+- Make it SEO-friendly with trending keywords
+
+"description": a complete YouTube video description structured exactly like this:
+1. Write exactly 10 lines of engaging description about what viewers will see
+2. Add a line break then write "Keywords:" followed by exactly 20 relevant keywords separated by commas
+3. Add a line break then write "Hashtags:" followed by exactly 30 hashtags (include #shorts, #viral, #trending and other relevant ones)
+4. Add a line break then add this copyright disclaimer: "⚠️ Copyright Disclaimer: This content is used for educational and entertainment purposes. All rights belong to their respective owners. If you are the owner and want this removed, please contact us."
+
+Make sure to include trending keywords and hashtags relevant to the actual video content.
+"""
+
+METADATA_PROMPT = "Create the YouTube metadata for these video frames."
+
+# Frames sampled per video for the metadata request; every one is sent to Gemini
+# (at 1/3 and 2/3 of the duration), so none is decoded for nothing
+METADATA_NUM_FRAMES = 2
+
+# Structured output returned by the combined metadata request
+METADATA_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "analysis": {"type": "STRING"},
+        "title": {"type": "STRING"},
+        "description": {"type": "STRING"},
+    },
+    "required": ["analysis", "title", "description"],
+}
+
+METADATA_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": METADATA_RESPONSE_SCHEMA,
+}
+
+# Hashtags and the "Keywords:" line parsed out of generated descriptions
+HASHTAG_RE = re.compile(r'#\w+')
+HASHTAGS_LINE_RE = re.compile(r'^Hashtags:(.*)$', re.M)
+KEYWORDS_RE = re.compile(r'^Keywords:[ \t]*(.+)$', re.M)
+
+# Batch job states after which polling stops
+BATCH_DONE_STATES = {
+    'JOB_STATE_SUCCEEDED',
+    'JOB_STATE_FAILED',
+    'JOB_STATE_CANCELLED',
+    'JOB_STATE_EXPIRED',
+}
+
+def _frame_to_blob(image: 'Image.Image', quality: int = 85) -> Dict:
+    """Encode a PIL frame as an inline JPEG blob, far smaller than the raw RGB image"""
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', quality=quality, optimize=False)
+    return {"mime_type": "image/jpeg", "data": buf.getvalue()}
+
+def _frame_to_image(frame) -> 'Image.Image':
+    """Scale and convert to RGB in a single swscale pass, straight into PIL"""
+    return frame.reformat(width=512, height=512, format='rgb24', interpolation='LANCZOS').to_image()
+
+def _is_constant_frame_rate(stream, tolerance: float = 0.01) -> bool:
+    """Whether the stream's average frame rate is within tolerance of its base (container) rate
+
+    Phone footage often reports an average like 1587000/52973 (~29.96) against a
+    base rate of 30, so an exact comparison would misclassify it as VFR.
+    """
+    average_rate, base_rate = stream.average_rate, stream.base_rate
+    if not average_rate or not base_rate:
+        return False
+    return abs(float(average_rate) - float(base_rate)) <= float(base_rate) * tolerance
+
+def _decode_seeking(container, stream, targets: List[int]) -> List:
+    """Seek to the keyframe before each target pts, then decode forward to it"""
+    frames = []
+    for target_pts in targets:
+        container.seek(target_pts, backward=True, any_frame=False, stream=stream)
+        for frame in container.decode(stream):
+            if frame.pts is None or frame.pts >= target_pts:
+                frames.append(_frame_to_image(frame))
+                break
+    return frames
+
+def _decode_keyframes(container, stream, targets: List[int]) -> List:
+    """Seek to the keyframe at or before each target pts and take it, decoding nothing past it"""
+    frames = []
+    for target_pts in targets:
+        container.seek(target_pts, backward=True, any_frame=False, stream=stream)
+        frame = next(iter(container.decode(stream)), None)
+        if frame is not None:
+            frames.append(_frame_to_image(frame))
+    return frames
+
+def _decode_sequential(container, stream, targets: List[int]) -> List:
+    """Decode forward once without seeking, converting only the frames that reach each target"""
+    frames = []
+    pending = list(targets)
+    for frame in container.decode(stream):
+        if frame.pts is None or frame.pts >= pending[0]:
+            frames.append(_frame_to_image(frame))
+            pending.pop(0)
+            if not pending:
+                break
+    return frames
+
+def _extract_frames(video_path: str, num_frames: int = 3, exact: bool = True) -> List:
+    """Extract representative frames from video for AI analysis
+
+    Module level so it can run in worker processes. With exact=False each sample
+    is the keyframe at or before its target timestamp and only keyframes are
+    decoded. Streams that look variable-frame-rate (or report no rates) always
+    take one full sequential decode pass, since keyframe-anchored sampling is
+    unreliable for them; that fallback is much slower on long videos.
+    """
+    # Imported here so loading this module (e.g. just for save_metadata) doesn't pull in libav
+    import av
+    
+    try:
+        container = av.open(video_path)
+        try:
+            stream = container.streams.video[0]
+            stream.codec_context.thread_type = 'AUTO'
+            time_base = stream.time_base
+            start_pts = stream.start_time or 0
+            if stream.duration:
+                duration = float(stream.duration * time_base)
+            else:
+                duration = container.duration / av.time_base
+            
+            # Extract frames at regular intervals
+            targets = [
+                start_pts + int((i + 1) * duration / (num_frames + 1) / time_base)
+                for i in range(num_frames)
+            ]
+            if not targets:
+                frames = []
+            elif not _is_constant_frame_rate(stream):
+                frames = _decode_sequential(container, stream, targets)
+            elif exact:
+                frames = _decode_seeking(container, stream, targets)
+            else:
+                frames = _decode_keyframes(container, stream, targets)
+        finally:
+            container.close()
+        
+        return frames
+        
+    except Exception as e:
+        print(f"Error extracting frames: {e}")
+        return []
+
+def video_content_key(video_path: str) -> str:
+    """Cheap fingerprint of a video file: hash of its first 64 KB plus its size"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(video_path, 'rb') as f:
+        digest.update(f.read(64 * 1024))
+    digest.update(str(os.path.getsize(video_path)).encode())
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=32)
+def _extract_frames_cached(content_key: str, video_path: str, num_frames: int, exact: bool) -> tuple:
+    """In-memory cache of extracted frames keyed by video content"""
+    frames = tuple(_extract_frames(video_path, num_frames, exact))
+    # lru_cache doesn't store raised calls, so failed decodes are retried next time
+    if not frames:
+        raise ValueError(f"No frames extracted from {video_path}")
+    return frames
+
 class AIMetadataGenerator:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None,
+                 metadata_cache_dir: Optional[str] = '.metadata_cache'):
         """Initialize the AI Metadata Generator with Gemini 2.0 Flash"""
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("Gemini API key not found. Please set GEMINI_API_KEY in .env file or pass it as parameter.")
         
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        self.metadata_model = genai.GenerativeModel(MODEL_NAME, system_instruction=METADATA_INSTRUCTION)
+        # Reel content is immutable, so generated metadata can be reused across runs
+        self.metadata_cache = diskcache.Cache(metadata_cache_dir) if metadata_cache_dir else None
     
-    def extract_video_frames(self, video_path: str, num_frames: int = 3) -> List[str]:
+    def extract_video_frames(self, video_path: str, num_frames: int = 3, exact: bool = True) -> List[str]:
         """Extract representative frames from video for AI analysis"""
         try:
-            cap = cv2.VideoCapture(video_path)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            frames = []
-            
-            # Extract frames at regular intervals
-            for i in range(num_frames):
-                frame_number = int((i + 1) * frame_count / (num_frames + 1))
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-                ret, frame = cap.read()
-                
-                if ret:
-                    # Convert BGR to RGB
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    # Convert to PIL Image
-                    pil_image = Image.fromarray(frame_rgb)
-                    # Resize for efficient processing
-                    pil_image = pil_image.resize((512, 512), Image.Resampling.LANCZOS)
-                    frames.append(pil_image)
-            
-            cap.release()
-            return frames
-            
-        except Exception as e:
+            content_key = video_content_key(video_path)
+        except OSError as e:
             print(f"Error extracting frames: {e}")
             return []
-    
-    def analyze_video_content(self, video_path: str) -> str:
-        """Analyze video content using AI vision to understand what's actually in the video"""
         try:
-            frames = self.extract_video_frames(video_path, 2)
-            
-            if not frames:
-                return "Unable to analyze video content"
-            
-            # Analyze the first frame for content
-            frame = frames[0]
-            
-            prompt = """
-            Analyze this video frame and describe what you see briefly. Focus on:
-            1. Main subject/person and their actions
-            2. Setting/location 
-            3. Key objects or activities visible
-            4. Overall mood and style
-            
-            Keep the description concise and specific to what's actually shown in the image.
-            """
-            
-            response = self.model.generate_content([prompt, frame])
-            return response.text.strip()
-            
-        except Exception as e:
-            print(f"Error analyzing video content: {e}")
-            return "Video content analysis unavailable"
+            return list(_extract_frames_cached(content_key, video_path, num_frames, exact))
+        except ValueError:
+            return []
     
-    def generate_title(self, video_analysis: str) -> str:
-        """Generate engaging YouTube title based on actual video content"""
-        prompt = f"""
-        Based on this video analysis, create a catchy YouTube title:
-        
-        VIDEO CONTENT: {video_analysis}
+    def extract_frames_many(self, video_paths: List[str], num_frames: int = 3, exact: bool = True,
+                            max_workers: Optional[int] = None) -> List[List]:
+        """Extract frames for several videos in parallel worker processes"""
+        if len(video_paths) <= 1:
+            return [_extract_frames(path, num_frames, exact) for path in video_paths]
         
-        Requirements:
-        - Make it engaging and click-worthy
-        - Keep it under 80 characters
-        - Focus on the main subject/activity in the video
-        - Make it SEO-friendly with trending keywords
-        
-        Return only the title, nothing else.
-        """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip().replace('"', '').replace("'", "")
-        except Exception as e:
-            print(f"Error generating title: {e}")
-            return "Amazing Video Content"
+        workers = min(max_workers or os.cpu_count() or 1, len(video_paths))
+        count = len(video_paths)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_extract_frames, video_paths, [num_frames] * count, [exact] * count))
     
-    def generate_description(self, video_analysis: str) -> str:
-        """Generate complete YouTube description with everything needed"""
-        prompt = f"""
-        Create a complete YouTube video description based on this video analysis:
-        
-        VIDEO CONTENT: {video_analysis}
-        
-        Structure the description exactly like this:
-        
-        1. Write exactly 10 lines of engaging description about what viewers will see
-        2. Add a line break then write "Keywords:" followed by exactly 20 relevant keywords separated by commas
-        3. Add a line break then write "Hashtags:" followed by exactly 30 hashtags (include #shorts, #viral, #trending and other relevant ones)
-        4. Add a line break then add this copyright disclaimer: "⚠️ Copyright Disclaimer: This content is used for educational and entertainment purposes. All rights belong to their respective owners. If you are the owner and want this removed, please contact us."
-        
-        Make sure to include trending keywords and hashtags relevant to the actual video content.
-        """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f"Error generating description: {e}")
-            return self._fallback_description()
+    def extract_metadata_frames(self, video_path: str) -> List:
+        """Frames for the metadata request: representative keyframes, no inter-frame decoding"""
+        return self.extract_video_frames(video_path, METADATA_NUM_FRAMES, exact=False)
     
     def _fallback_description(self) -> str:
         """Fallback description when AI generation fails"""
@@ -146,34 +260,40 @@ Hashtags: #shorts #viral #trending #amazing #entertainment #video #content #soci
 
 ⚠️ Copyright Disclaimer: This content is used for educational and entertainment purposes. All rights belong to their respective owners. If you are the owner and want this removed, please contact us."""
     
-    def generate_complete_metadata(self, video_path: str, **kwargs) -> Dict:
-        """Generate complete metadata package based on actual video analysis"""
-        
-        print("🤖 Analyzing video content with AI...")
-        video_analysis = self.analyze_video_content(video_path)
-        print(f"📹 Video analysis complete")
-        
-        print("🎯 Generating title...")
-        title = self.generate_title(video_analysis)
-        
-        print("📝 Generating description with keywords and hashtags...")
-        description = self.generate_description(video_analysis)
+    def generate_metadata_fields(self, frames: List) -> Dict:
+        """Generate analysis, title and description from video frames in one AI request"""
+        response = self.metadata_model.generate_content(
+            [METADATA_PROMPT, *map(_frame_to_blob, frames)],
+            generation_config=METADATA_GENERATION_CONFIG,
+        )
+        return json.loads(response.text)
+    
+    async def generate_metadata_fields_async(self, frames: List) -> Dict:
+        """Async variant of generate_metadata_fields using the SDK's async client"""
+        response = await self.metadata_model.generate_content_async(
+            [METADATA_PROMPT, *map(_frame_to_blob, frames)],
+            generation_config=METADATA_GENERATION_CONFIG,
+        )
+        return json.loads(response.text)
+    
+    def _build_metadata(self, fields: Optional[Dict]) -> Dict:
+        """Assemble the metadata package from generated fields, falling back when missing"""
+        if fields:
+            video_analysis = fields['analysis'].strip()
+            title = fields['title'].strip().replace('"', '').replace("'", "")
+            description = fields['description'].strip()
+        else:
+            video_analysis = "Video content analysis unavailable"
+            title = "Amazing Video Content"
+            description = self._fallback_description()
         
         # Extract hashtags and keywords from description for separate fields
-        description_lines = description.split('\n')
-        hashtags = []
-        keywords = []
-        tags = []
-        
-        for line in description_lines:
-            if line.startswith('Hashtags:'):
-                hashtags_text = line.replace('Hashtags:', '').strip()
-                hashtags = [tag.strip() for tag in hashtags_text.split() if tag.startswith('#')]
-            elif line.startswith('Keywords:'):
-                keywords_text = line.replace('Keywords:', '').strip()
-                keywords = [kw.strip() for kw in keywords_text.split(',')]
-                # Use first 15 keywords as tags for YouTube
-                tags = keywords[:15]
+        match = HASHTAGS_LINE_RE.search(description)
+        hashtags = HASHTAG_RE.findall(match.group(1)) if match else []
+        match = KEYWORDS_RE.search(description)
+        keywords = [kw.strip() for kw in match.group(1).split(',')] if match else []
+        # Use first 15 keywords as tags for YouTube
+        tags = keywords[:15]
         
         metadata = {
             "video_analysis": video_analysis,
@@ -187,11 +307,178 @@ Hashtags: #shorts #viral #trending #amazing #entertainment #video #content #soci
         
         return metadata
     
+    def _metadata_cache_key(self, video_path: str) -> Optional[str]:
+        """Key for the metadata cache, or None when caching is off or the file is unreadable"""
+        if self.metadata_cache is None:
+            return None
+        try:
+            return f"{video_content_key(video_path)}:{MODEL_NAME}"
+        except OSError:
+            return None
+    
+    def _store_metadata(self, cache_key: Optional[str], fields: Optional[Dict]) -> Dict:
+        """Build the metadata package and cache it when it came from the model"""
+        metadata = self._build_metadata(fields)
+        # Fallback metadata is not cached so the next run retries the model
+        if cache_key and fields:
+            self.metadata_cache.set(cache_key, metadata)
+        return metadata
+    
+    def _cached_metadata(self, cache_key: Optional[str]) -> Optional[Dict]:
+        """Return previously generated metadata for this cache key, if any"""
+        cached = self.metadata_cache.get(cache_key) if cache_key else None
+        if cached is None:
+            return None
+        print("♻️ Using cached metadata for this video")
+        return {**cached, "generated_at": datetime.now().isoformat()}
+    
+    def _lookup_metadata(self, video_path: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Cache key for the video and its cached metadata, if any"""
+        cache_key = self._metadata_cache_key(video_path)
+        return cache_key, self._cached_metadata(cache_key)
+    
+    def _checked_frames(self, frames: List) -> List:
+        """Validate extracted frames before they are sent to the model"""
+        if not frames:
+            raise Exception("Unable to analyze video content")
+        print("🤖 Analyzing video content and generating metadata with AI...")
+        return frames
+    
+    def _finish_metadata(self, cache_key: Optional[str], fields: Optional[Dict] = None,
+                         error: Optional[Exception] = None) -> Dict:
+        """Report the outcome of a generation, then build (and cache) the metadata package"""
+        if error is not None:
+            print(f"Error generating metadata: {error}")
+            fields = None
+        else:
+            print(f"📹 Video analysis complete")
+        return self._store_metadata(cache_key, fields)
+    
+    def _generate_from_frames(self, cache_key: Optional[str], load_frames: Callable[[], List]) -> Dict:
+        """Generate (and cache) the metadata package from frames supplied by load_frames"""
+        try:
+            frames = self._checked_frames(load_frames())
+            fields = self.generate_metadata_fields(frames)
+        except Exception as e:
+            return self._finish_metadata(cache_key, error=e)
+        return self._finish_metadata(cache_key, fields)
+    
+    def generate_complete_metadata(self, video_path: str, **kwargs) -> Dict:
+        """Generate complete metadata package based on actual video analysis"""
+        
+        cache_key, cached = self._lookup_metadata(video_path)
+        if cached is not None:
+            return cached
+        
+        return self._generate_from_frames(cache_key, lambda: self.extract_metadata_frames(video_path))
+    
+    def stream_metadata(self, video_paths: List[str]) -> Iterator[Dict]:
+        """Yield metadata per video, decoding the next video while the current Gemini call runs"""
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            def prefetch(index: int):
+                if index >= len(video_paths):
+                    return None, None
+                cache_key, cached = self._lookup_metadata(video_paths[index])
+                # Cached videos need no frames, so hand back their metadata instead
+                if cached is not None:
+                    return cache_key, cached
+                return cache_key, executor.submit(self.extract_metadata_frames, video_paths[index])
+            
+            upcoming = prefetch(0)
+            for index in range(len(video_paths)):
+                cache_key, current = upcoming
+                upcoming = prefetch(index + 1)
+                
+                if isinstance(current, Future):
+                    yield self._generate_from_frames(cache_key, current.result)
+                else:
+                    yield current
+    
+    async def generate_complete_metadata_async(self, video_path: str, **kwargs) -> Dict:
+        """Async variant of generate_complete_metadata for overlapping with other I/O"""
+        
+        cache_key, cached = self._lookup_metadata(video_path)
+        if cached is not None:
+            return cached
+        
+        try:
+            frames = self._checked_frames(await asyncio.to_thread(self.extract_metadata_frames, video_path))
+            fields = await self.generate_metadata_fields_async(frames)
+        except Exception as e:
+            return self._finish_metadata(cache_key, error=e)
+        return self._finish_metadata(cache_key, fields)
+    
+    def generate_complete_metadata_batch(self, video_paths: List[str], poll_interval: int = 30) -> List[Dict]:
+        """Generate metadata for many videos through the Gemini Batch API (cheaper, not real-time)"""
+        try:
+            # Batch jobs are only exposed by the newer google-genai SDK
+            from google import genai as genai_sdk
+        except ImportError:
+            raise ImportError("Gemini Batch Mode requires the google-genai package: pip install google-genai")
+        
+        cache_keys = [self._metadata_cache_key(path) for path in video_paths]
+        cached = [self._cached_metadata(key) for key in cache_keys]
+        # Only videos without cached metadata are decoded and sent
+        todo = [index for index, metadata in enumerate(cached) if metadata is None]
+        extracted = self.extract_frames_many([video_paths[i] for i in todo], METADATA_NUM_FRAMES, exact=False)
+        frames_per_video = dict(zip(todo, extracted))
+        
+        # Only videos with frames are submitted; remember where each result belongs
+        submitted = []
+        batch_requests = []
+        for index, frames in frames_per_video.items():
+            if not frames:
+                print(f"Error extracting frames for {video_paths[index]}, using fallback metadata")
+                continue
+            parts = [{"text": METADATA_PROMPT}]
+            parts += [{"inline_data": _frame_to_blob(frame)} for frame in frames]
+            batch_requests.append({
+                "contents": [{"role": "user", "parts": parts}],
+                "config": {"system_instruction": METADATA_INSTRUCTION, **METADATA_GENERATION_CONFIG},
+            })
+            submitted.append(index)
+        
+        results = [None] * len(video_paths)
+        if batch_requests:
+            client = genai_sdk.Client(api_key=self.api_key)
+            job = client.batches.create(
+                model=MODEL_NAME,
+                src=batch_requests,
+                config={"display_name": f"metadata-{datetime.now():%Y%m%d-%H%M%S}"},
+            )
+            print(f"📦 Submitted batch job {job.name} with {len(batch_requests)} videos")
+            
+            while job.state.name not in BATCH_DONE_STATES:
+                time.sleep(poll_interval)
+                job = client.batches.get(name=job.name)
+            
+            # A failed job leaves results empty, so those videos get cached or fallback metadata
+            responses = []
+            if job.state.name != 'JOB_STATE_SUCCEEDED':
+                print(f"Error: batch job {job.name} finished with state {job.state.name}, using fallback metadata")
+            elif job.dest is None or not job.dest.inlined_responses:
+                print(f"Error: batch job {job.name} returned no responses, using fallback metadata")
+            else:
+                responses = job.dest.inlined_responses
+            
+            for index, item in zip(submitted, responses):
+                try:
+                    if item.error:
+                        raise Exception(item.error)
+                    results[index] = json.loads(item.response.text)
+                except Exception as e:
+                    print(f"Error generating metadata for {video_paths[index]}: {e}")
+        
+        return [
+            metadata if metadata is not None else self._store_metadata(key, fields)
+            for metadata, key, fields in zip(cached, cache_keys, results)
+        ]
+    
     def save_metadata(self, metadata: Dict, output_path: str):
         """Save metadata to JSON file"""
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
             print(f"Metadata saved to: {output_path}")
         except Exception as e:
             print(f"Error saving metadata: {e}")
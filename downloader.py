@@ -1,7 +1,12 @@
 import instaloader
 import os
+import shutil
+import threading
+import time
+import requests
+import urllib3
 from urllib.parse import urlparse
-from typing import Optional
+from typing import List, Optional
 
 def extract_shortcode(reel_url: str) -> str:
     """Extract shortcode from Instagram URL"""
@@ -11,74 +16,134 @@ def extract_shortcode(reel_url: str) -> str:
     if len(parts) >= 2 and parts[0] in {"reel", "p"}:
         return parts[1]
     return parts[-1] if parts else ""
-def download_reel_with_audio(
-    reel_url: str,
-    download_dir: str = "downloads",
-    username: Optional[str] = None,
-    sessionfile: Optional[str] = None,
-    cookiefile: Optional[str] = None,
-) -> str:
-    """Download Instagram Reel with audio"""
-    """Download Instagram Reel with audio"""
-    try:
-        L = instaloader.Instaloader(
+
+class ReelDownloader:
+    """Download Instagram Reels, reusing one Instaloader session across downloads"""
+
+    def __init__(self, download_dir: str = "downloads"):
+        self.download_dir = download_dir
+        self.max_attempts = 3
+        # Built once so every download shares the same HTTP session and connections
+        self.L = instaloader.Instaloader(
             download_videos=True,
             download_video_thumbnails=False,
             download_geotags=False,
             download_comments=False,
             save_metadata=False,
             compress_json=False,
-            max_connection_attempts=3,
+            max_connection_attempts=self.max_attempts,
         )
+        # InstaloaderContext (session, rate controller) is not thread-safe
+        self._lock = threading.Lock()
+        # Pooled keep-alive sessions for fetching the video files from the CDN, one per thread
+        self._local = threading.local()
 
-       
+    @property
+    def session(self) -> requests.Session:
+        """CDN session for the calling thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
 
-        # Extract shortcode from URL
-        shortcode = extract_shortcode(reel_url)
+    def _lookup_video(self, shortcode: str):
+        """Fetch the post and its video URL through the shared Instaloader context"""
+        with self._lock:
+            # Get the post
+            post = instaloader.Post.from_shortcode(self.L.context, shortcode)
 
-        # Get the post
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
+            # Get video URL (contains audio)
+            video_url = post.video_url
+            if not video_url:
+                # Handle sidecar posts (multiple media)
+                if post.typename == "GraphSidecar":
+                    for node in post.get_sidecar_nodes():
+                        if node.is_video:
+                            video_url = node.video_url
+                            break
+        return post, video_url
 
-        # Get video URL (contains audio)
-        video_url = post.video_url
-        if not video_url:
-            # Handle sidecar posts (multiple media)
-            if post.typename == "GraphSidecar":
-                for node in post.get_sidecar_nodes():
-                    if node.is_video:
-                        video_url = node.video_url
-                        break
-        
-        if not video_url:
-            raise Exception("No video URL found for this post")
+    def _stream_to_file(self, url: str, target_path: str):
+        """Stream url to target_path via a .part file, retrying failed transfers"""
+        part_path = target_path + ".part"
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with self.session.get(url, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    with open(part_path, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, length=1 << 20)
+                    expected = response.headers.get('Content-Length')
+                    if expected and 'Content-Encoding' not in response.headers \
+                            and os.path.getsize(part_path) != int(expected):
+                        raise OSError(f"incomplete download ({os.path.getsize(part_path)} of {expected} bytes)")
+                # Only a completed transfer ever appears at the final path
+                os.replace(part_path, target_path)
+                return
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                if attempt == self.max_attempts:
+                    raise
+                print(f"Download attempt {attempt} failed ({e}), retrying...")
+                time.sleep(attempt)
 
-        # Create download directory
-        os.makedirs(download_dir, exist_ok=True)
-        
-        # Build filename
-        filename_base = f"reel_{shortcode}"
-        filepath_no_ext = os.path.join(download_dir, filename_base)
+    def download(self, reel_url: str, download_dir: Optional[str] = None) -> str:
+        """Download Instagram Reel with audio"""
+        download_dir = download_dir or self.download_dir
+        try:
+            # Extract shortcode from URL
+            shortcode = extract_shortcode(reel_url)
 
-        print("Downloading video with audio...")
-        # Download the video file with audio
-        L.download_pic(filename=filepath_no_ext, url=video_url, mtime=post.date_utc)
+            post, video_url = self._lookup_video(shortcode)
+            if not video_url:
+                raise Exception("No video URL found for this post")
 
-        # Find the downloaded file
-        target_path = filepath_no_ext + ".mp4"
-        if not os.path.exists(target_path):
-            # Look for any file starting with our base name
-            for f in os.listdir(download_dir):
-                if f.startswith(filename_base):
-                    target_path = os.path.join(download_dir, f)
-                    break
+            # Create download directory
+            os.makedirs(download_dir, exist_ok=True)
+            
+            # Build filename
+            target_path = os.path.join(download_dir, f"reel_{shortcode}.mp4")
 
-        if not os.path.exists(target_path):
-            raise Exception("Download completed but file not found")
+            print("Downloading video with audio...")
+            self._stream_to_file(video_url, target_path)
+            mtime = post.date_utc.timestamp()
+            os.utime(target_path, (mtime, mtime))
 
-        return target_path
+            return target_path
 
-    except Exception as e:
-        raise Exception(f"Failed to download reel: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Failed to download reel: {str(e)}")
+
+    def download_many(self, reel_urls: List[str], download_dir: Optional[str] = None) -> List[Optional[str]]:
+        """Download several reels over the same session; failed downloads are returned as None"""
+        paths = []
+        for reel_url in reel_urls:
+            try:
+                paths.append(self.download(reel_url, download_dir))
+            except Exception as e:
+                print(f"❌ {reel_url}: {str(e)}")
+                paths.append(None)
+        return paths
+
+# Shared downloader so every call (from any thread) reuses the same Instaloader session;
+# ReelDownloader serialises its Instaloader lookups itself
+_default_downloader: Optional[ReelDownloader] = None
+_default_downloader_lock = threading.Lock()
+
+def download_reel_with_audio(
+    reel_url: str,
+    download_dir: str = "downloads",
+    username: Optional[str] = None,
+    sessionfile: Optional[str] = None,
+    cookiefile: Optional[str] = None,
+) -> str:
+    """Download Instagram Reel with audio"""
+    global _default_downloader
+    with _default_downloader_lock:
+        if _default_downloader is None:
+            _default_downloader = ReelDownloader(download_dir)
+    return _default_downloader.download(reel_url, download_dir)
 
 def main():
     """Main function with user interaction"""
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+from downloader import ReelDownloader
+from ai_generator import AIMetadataGenerator
+
+# Load environment variables from .env file
+load_dotenv()
+
+async def _download_reels(downloader: ReelDownloader, reel_urls: List[str], queue: asyncio.Queue, concurrency: int):
+    """Producer: download reels a few at a time and hand them to the analysis queue"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def download(index: int, reel_url: str):
+        async with semaphore:
+            try:
+                video_path = await asyncio.to_thread(downloader.download, reel_url)
+                await queue.put((index, reel_url, video_path, None))
+            except Exception as e:
+                await queue.put((index, reel_url, None, str(e)))
+
+    await asyncio.gather(*(download(i, url) for i, url in enumerate(reel_urls)))
+    # Tell the consumer there is nothing more to analyze
+    await queue.put(None)
+
+async def _analyze_reels(generator: AIMetadataGenerator, queue: asyncio.Queue, results: List[Optional[Dict]]):
+    """Consumer: generate metadata for each downloaded reel as soon as it arrives"""
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+
+        index, reel_url, video_path, error = item
+        metadata = None
+        if video_path:
+            print(f"🤖 Generating metadata for {reel_url}")
+            metadata = await generator.generate_complete_metadata_async(video_path)
+        else:
+            print(f"❌ Download failed for {reel_url}: {error}")
+
+        results[index] = {
+            "url": reel_url,
+            "video_path": video_path,
+            "metadata": metadata,
+            "error": error,
+        }
+
+async def process_reels_async(
+    reel_urls: List[str],
+    download_dir: str = "downloads",
+    concurrency: int = 3,
+    generator: Optional[AIMetadataGenerator] = None,
+) -> List[Dict]:
+    """Download reels and generate their metadata, overlapping downloads with AI analysis"""
+    generator = generator or AIMetadataGenerator()
+    # Dedicated downloader; its Instaloader lookups are serialised, CDN streams run in parallel
+    downloader = ReelDownloader(download_dir)
+    # Bound the queue so downloads don't run too far ahead of the analysis
+    queue = asyncio.Queue(maxsize=concurrency)
+    results = [None] * len(reel_urls)
+
+    await asyncio.gather(
+        _download_reels(downloader, reel_urls, queue, concurrency),
+        _analyze_reels(generator, queue, results),
+    )
+    return results
+
+def process_reels(reel_urls: List[str], download_dir: str = "downloads", concurrency: int = 3) -> List[Dict]:
+    """Synchronous entry point for process_reels_async"""
+    return asyncio.run(process_reels_async(reel_urls, download_dir, concurrency))
+
+if __name__ == "__main__":
+    import sys
+
+    urls = [url.strip() for url in sys.argv[1:] if url.strip()]
+    if not urls:
+        print("Usage: python pipeline.py <reel_url> [<reel_url> ...]")
+        sys.exit(1)
+
+    for result in process_reels(urls):
+        status = result['metadata']['title'] if result['metadata'] else f"failed: {result['error']}"
+        print(f"{result['url']} -> {status}")